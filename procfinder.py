@@ -5,12 +5,79 @@ distributions searching for signs of malware.
 '''
 
 import os
-import re
 import argparse
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 __version__ = 'ProcFinder 0.4.0'
 
+_SUSPICIOUS_CWDS = ('/tmp', '/dev/shm', '/var/tmp')
+
+_CHECKS = ('deleted', 'path', 'promiscuous', 'thread', 'cwd', 'preload')
+
+
+def _list_pids():
+    '''
+    Returns a list of every PID currently in /proc.
+    '''
+
+    with os.scandir('/proc') as proc_entries:
+        return [int(entry.name) for entry in proc_entries if entry.name.isdigit()]
+
+
+def _slurp(path, dir_fd=None):
+    '''
+    Returns the raw contents of a small file, such
+    as those in procfs, without going through the
+    buffered and text layers of open(). A relative
+    path is resolved against dir_fd if given.
+    '''
+
+    fd = os.open(path, os.O_RDONLY, dir_fd=dir_fd)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+    finally:
+        os.close(fd)
+
+
+def _iter_dir(path, dir_fd):
+    '''
+    Yields the entry names of the directory at path,
+    resolved relative to the open directory dir_fd.
+    '''
+
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+    try:
+        with os.scandir(fd) as entries:
+            for entry in entries:
+                yield entry.name
+    finally:
+        os.close(fd)
+
+
+def _read_exe_links(pids):
+    '''
+    Returns a dict of PIDs to their exe link. Kernel
+    threads and terminated procs have no readable
+    exe link and are left out. The links are used to
+    skip kernel threads and to name PIDs in the
+    output; the deleted check reads exe again.
+    '''
+
+    exe_links = {}
+    for pid in pids:
+        try:
+            exe_links[pid] = os.readlink('/proc/{}/exe'.format(pid))
+        except OSError:    # kernel thread or proc has already terminated
+            continue
+    return exe_links
+
 
 class Colors():
 
@@ -36,7 +103,9 @@ class ProcFinder():
             class_colors = Colors()
             class_colors.warning("ProcFinder is intended to only be ran on a *nix OS with a procfs.")
             raise SystemExit()
-        self._pids = [int(pid) for pid in os.listdir('/proc') if pid.isdigit()]
+        self._pids = _list_pids()
+        # Exe links are read on first use so --pids only reads its own PIDs
+        self._exe_links = None
 
 
     def __str__(self):
@@ -56,25 +125,154 @@ class ProcFinder():
                     self._pids = pid_list
                 else:
                     raise TypeError("PIDs must be in an integer.")
+            self._exe_links = None
         else:
             raise TypeError("PIDs must be in a list format.")
 
 
+    @property
+    def exe_links(self):
+        if self._exe_links is None:
+            self._exe_links = _read_exe_links(self._pids)
+        return self._exe_links
+
+
+    @property
+    def user_pids(self):
+        exe_links = self.exe_links
+        return [pid for pid in self._pids if pid in exe_links]
+
+
+    def run_all_checks(self, checks=_CHECKS):
+        '''
+        Runs the per-PID checks named in checks, all of
+        them by default, in a single pass over the user
+        space PIDs, skipping kernel threads, and returns
+        a dict of PID lists keyed by check name. The
+        promiscuous entry is -1 if /proc/net/packet
+        does not exist.
+        '''
+
+        results = {check: [] for check in checks}
+        inode_set = None
+        if 'promiscuous' in checks:
+            if os.path.isfile('/proc/net/packet') == False:
+                results['promiscuous'] = -1
+            else:
+                packet_read = _slurp('/proc/net/packet').decode().splitlines()
+                inode_set = {i.rsplit(None, 1)[1] for i in packet_read[1::]}
+
+        user_pids = self.user_pids
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+            scans = executor.map(lambda pid: self._scan_pid(pid, inode_set, checks), user_pids)
+            for pid, (flags, link) in zip(user_pids, scans):
+                if link is not None:
+                    self._exe_links[pid] = link
+                for check, flagged in flags.items():
+                    if flagged:
+                        results[check].append(pid)
+        return results
+
+
+    def _scan_pid(self, pid, inode_set, checks=_CHECKS):
+        '''
+        Runs the checks named in checks against a single
+        PID and returns a tuple of a dict of booleans
+        keyed by check name and the exe link read, or
+        None if it was not read. inode_set holds the
+        packet socket inodes and is None when the
+        promiscuous check is not possible.
+        '''
+
+        flags = {check: False for check in checks}
+        link = None
+
+        # Resolve /proc/<pid> once and open everything else relative to it
+        try:
+            pid_fd = os.open('/proc/{}'.format(pid), os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:    # proc has already terminated
+            return flags, link
+
+        try:
+            if 'deleted' in checks:
+                # Read exe again rather than trusting the link cached by
+                # __init__ as the binary may have been removed since then
+                try:
+                    link = os.readlink('exe', dir_fd=pid_fd)
+                    if link.endswith(' (deleted)'):
+                        flags['deleted'] = True
+                except OSError:    # proc has already terminated
+                    pass
+
+            if 'cwd' in checks:
+                try:
+                    open_cwd = os.readlink('cwd', dir_fd=pid_fd)
+                    if open_cwd.startswith(_SUSPICIOUS_CWDS):
+                        flags['cwd'] = True
+                except OSError:    # proc has already terminated
+                    pass
+
+            if 'path' in checks or 'preload' in checks:
+                try:
+                    # Leading NUL lets every variable be matched as NUL + NAME=
+                    env = b'\x00' + _slurp('environ', dir_fd=pid_fd)
+                    if 'path' in checks:
+                        # environ may hold more than one PATH entry, check each of them
+                        path_start = env.find(b'\x00PATH=')
+                        while path_start != -1:
+                            path_start += len(b'\x00PATH=')
+                            path_end = env.find(b'\x00', path_start)
+                            if path_end == -1:
+                                path_end = len(env)
+                            if env.find(b'.', path_start, path_end) != -1:
+                                flags['path'] = True
+                                break
+                            path_start = env.find(b'\x00PATH=', path_end)
+                    if 'preload' in checks and b'\x00LD_PRELOAD=' in env:
+                        flags['preload'] = True
+                except OSError:    # proc has already terminated
+                    pass
+
+            if 'thread' in checks:
+                try:
+                    # Directory order is not numeric, so track the smallest and largest TID
+                    low = high = None
+                    for thread in _iter_dir('task', pid_fd):
+                        tid = int(thread)
+                        if low is None or tid < low:
+                            low = tid
+                        if high is None or tid > high:
+                            high = tid
+                    if low is not None and (high - low) > 1000:
+                        flags['thread'] = True
+                except OSError:    # proc has already terminated
+                    pass
+
+            if 'promiscuous' in checks and inode_set is not None:
+                try:
+                    for fd in _iter_dir('fd', pid_fd):
+                        try:
+                            fd_link = os.readlink('fd/' + fd, dir_fd=pid_fd)
+                        except OSError:    # fd has already been closed
+                            continue
+                        # Socket fd links have the form socket:[inode]
+                        if fd_link.startswith('socket:[') and fd_link[8:-1] in inode_set:
+                            flags['promiscuous'] = True
+                            break
+                except OSError:    # proc has already terminated
+                    pass
+        finally:
+            os.close(pid_fd)
+        return flags, link
+
+
     def deleted_check(self):
         '''
         Returns a list of PIDs whose binary has
         been deleted from disk.
         '''
 
-        deleted_pids = []
-        for pid in self.pids:
-            try:
-                link = os.readlink('/proc/{}/exe'.format(pid))
-                if re.match('.*\(deleted\)$', link):
-                    deleted_pids.append(pid)
-            except OSError:    # proc has already terminated
-                continue
-        return deleted_pids
+        return self.run_all_checks(('deleted',))['deleted']
 
 
     def path_check(self):
@@ -83,20 +281,7 @@ class ProcFinder():
         varibale contains a '.'
         '''
 
-        path_pids = []
-        for pid in self.pids:
-            try:
-                with open('/proc/{}/environ'.format(pid)) as open_env:
-                    # Creates a list of all the environment varliables for the process
-                    for i in open_env:
-                        env_list = i.split('\x00')
-                        # Loops through each environment varliable looking for '.' in its PATH
-                        for j in env_list:
-                            if re.match('^PATH=.*\..*', j):
-                                path_pids.append(pid)
-            except OSError:    # proc has already terminated
-                continue
-        return path_pids
+        return self.run_all_checks(('path',))['path']
 
 
     def promiscuous_check(self):
@@ -106,44 +291,34 @@ class ProcFinder():
         -1 if /proc/net/packet does not exist.
         '''
 
-        if os.path.isfile('/proc/net/packet') == False:
-            return -1
-        inode_list = []
-        promiscuous_pids = []
-        with open('/proc/net/packet') as packet:
-            packet_read = packet.readlines()
-            for i in packet_read[1::]:
-                inode_list.append(i.split()[-1])
-        for pid in self.pids:
-            try:
-                fd_list = [fd for fd in os.listdir('/proc/{}/fd'.format(pid))]
-            except OSError:    # proc has already terminated
-                continue
-            for link_list in fd_list:
-                try:
-                    fd_link = os.readlink('/proc/{}/fd/{}'.format(pid, link_list))
-                    fd_match = list(map(lambda x: re.findall(x, fd_link), inode_list))
-                    for i in fd_match:
-                        if len(i) > 0:
-                            if pid not in promiscuous_pids:
-                                promiscuous_pids.append(pid)
-                except OSError:    # proc has already terminated
-                    continue
-        return promiscuous_pids
+        return self.run_all_checks(('promiscuous',))['promiscuous']
 
 
     def ps_check(self):
         '''
-        Returns a list of PIDs whose PID do not match
-        with the on disk ps and the PIDs in /proc.
+        Returns a list of PIDs hidden from either the
+        on disk ps or the /proc listing. A PID only
+        one view shows is confirmed by looking up its
+        /proc/<pid> directory, so processes that start
+        or exit while the views are taken are ignored.
         '''
 
         ps = subprocess.Popen(['ps', '-eo', 'pid', '--no-headers'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
         output = ps.communicate(timeout=5)[0]
-        output_list = output.decode().split('\n')[:-2]
-        output_striped = [x.strip(' ') for x in output_list]
-        output_int = [int(x) for x in output_list]
-        return list(set(output_int).symmetric_difference(self.pids))
+        ps_pids = {int(x) for x in output.split()}
+        proc_pids = set(self.pids)
+        listed_pids = set(_list_pids())
+
+        hidden_pids = []
+        # Shown by ps but missing from /proc while /proc/<pid> still exists
+        for pid in ps_pids - proc_pids:
+            if pid not in listed_pids and os.path.isdir('/proc/{}'.format(pid)):
+                hidden_pids.append(pid)
+        # Listed in /proc before ps ran, still alive, but not shown by ps
+        for pid in proc_pids - ps_pids:
+            if os.path.isdir('/proc/{}'.format(pid)):
+                hidden_pids.append(pid)
+        return sorted(hidden_pids)
 
 
     def thread_check(self):
@@ -155,15 +330,7 @@ class ProcFinder():
         recommend running multiple times.
         '''
 
-        thread_pids = []
-        for pid in self.pids:
-            try:
-                thread_dirs = [thread for thread in os.listdir('/proc/{}/task'.format(pid))]
-                if (int(thread_dirs[-1]) - int(thread_dirs[0])) > 1000:
-                    thread_pids.append(pid)
-            except OSError:    # proc has already terminated
-                continue
-        return thread_pids
+        return self.run_all_checks(('thread',))['thread']
 
 
     def cwd_check(self):
@@ -172,15 +339,7 @@ class ProcFinder():
         either /tmp, /dev/shm, or /var/tmp.
         '''
 
-        cwd_pids = []
-        for pid in self.pids:
-            try:
-                open_cwd = os.readlink('/proc/{}/cwd'.format(pid))
-                if re.match('^/tmp.*|^/dev/shm.*|^/var/tmp.*', open_cwd):
-                    cwd_pids.append(pid)
-            except OSError:    # proc has already terminated
-                continue
-        return cwd_pids
+        return self.run_all_checks(('cwd',))['cwd']
 
 
     def preload_check(self):
@@ -189,21 +348,7 @@ class ProcFinder():
         is found as an environment variable.
         '''
 
-        preload_pids = []
-        for pid in self.pids:
-            try:
-                with open('/proc/{}/environ'.format(pid)) as open_env:
-                    # Creates a list of all the environment varliables for the process
-                    # TODO: replace for loop with env = open_env.read().split('\x00')
-                    for i in open_env:
-                        env_list = i.split('\x00')
-                        # Loops through each environment varliable looking for LD_PRELOAD
-                        for j in env_list:
-                            if re.match('LD_PRELOAD=.*', j):
-                                preload_pids.append(pid)
-            except OSError:    # proc has already terminated
-                continue
-        return preload_pids
+        return self.run_all_checks(('preload',))['preload']
 
 
 def ko_check():
@@ -232,14 +377,19 @@ def ko_check():
     return ko_list
 
 
-def pid_binary(pids):
+def pid_binary(pids, cache=None):
     '''
     Accepts a list of pids and returns
-    a list of the pids binary names.
+    a list of the pids binary names. Exe
+    links found in cache are used instead
+    of reading them again.
     '''
 
     binary_names = []
     for pid in pids:
+        if cache is not None and pid in cache:
+            binary_names.append(cache[pid])
+            continue
         try:
             binary = os.readlink('/proc/{}/exe'.format(pid))
             binary_names.append(binary)
@@ -253,12 +403,12 @@ def pid_binary(pids):
 
 def banner():
     banner = '\n'.join([
-        "  _____                ______ _           _",
-        " |  __ \              |  ____(_)         | |",
-        " | |__) | __ ___   ___| |__   _ _ __   __| | ___ _ __",
-        " |  ___/ '__/ _ \ / __|  __| | | '_ \ / _` |/ _ \ '__|",
-        " | |   | | | (_) | (__| |    | | | | | (_| |  __/ |",
-        " |_|   |_|  \___/ \___|_|    |_|_| |_|\__,_|\___|_|",
+        r"  _____                ______ _           _",
+        r" |  __ \              |  ____(_)         | |",
+        r" | |__) | __ ___   ___| |__   _ _ __   __| | ___ _ __",
+        r" |  ___/ '__/ _ \ / __|  __| | | '_ \ / _` |/ _ \ '__|",
+        r" | |   | | | (_) | (__| |    | | | | | (_| |  __/ |",
+        r" |_|   |_|  \___/ \___|_|    |_|_| |_|\__,_|\___|_|",
         "\n                 {}",
         "                 Author: wakef33\n",
     ]).format(__version__)
@@ -287,7 +437,6 @@ def main():
     p = ProcFinder()
     banner()
 
-    # TODO: Fix ps_check with --pids
     if args.pids != None:
         p.pids = args.pids
 
@@ -303,20 +452,22 @@ def main():
             if fail_test == "Found Suspicious Kernel Objects":
                 print()
             elif args.quiet == False:
-                print(pid_binary(check))
+                print(pid_binary(check, p.exe_links))
                 print()
 
     colors.note("PIDs Running")
     print(p)
     print()
 
-    present_test(p.deleted_check(), "Deleted Binaries Check", "No Deleted Binaries Running Found\n", "Found Deleted Binaries Running")
-    present_test(p.path_check(), "PATH Environment Variables Check", "No Suspicious PATH Environment Variables Found\n", "Found Suspicious PATH Environment Variables")
-    present_test(p.promiscuous_check(), "Promiscuous Binaries Check", "No Promiscuous Binaries Running Found\n", "Found Promiscuous Binaries Running")
+    results = p.run_all_checks()
+
+    present_test(results['deleted'], "Deleted Binaries Check", "No Deleted Binaries Running Found\n", "Found Deleted Binaries Running")
+    present_test(results['path'], "PATH Environment Variables Check", "No Suspicious PATH Environment Variables Found\n", "Found Suspicious PATH Environment Variables")
+    present_test(results['promiscuous'], "Promiscuous Binaries Check", "No Promiscuous Binaries Running Found\n", "Found Promiscuous Binaries Running")
     present_test(p.ps_check(), "Ps Check", "No Suspicious PIDs Found\n", "Found Suspicious PIDs")
-    present_test(p.thread_check(), "Thread Check", "No Suspicious Threads Found\n", "Found Suspicious Threads")
-    present_test(p.cwd_check(), "CWD Check", "No Suspicious CWD Found\n", "Found Suspicious CWD")
-    present_test(p.preload_check(), "LD_PRELOAD Check", "No Suspicious LD_PRELOAD Found\n", "Found Suspicious LD_PRELOAD")
+    present_test(results['thread'], "Thread Check", "No Suspicious Threads Found\n", "Found Suspicious Threads")
+    present_test(results['cwd'], "CWD Check", "No Suspicious CWD Found\n", "Found Suspicious CWD")
+    present_test(results['preload'], "LD_PRELOAD Check", "No Suspicious LD_PRELOAD Found\n", "Found Suspicious LD_PRELOAD")
     present_test(ko_check(), "Kernel Objects Check", "No Suspicious Kernel Objects Found", "Found Suspicious Kernel Objects")
 
 if __name__ == '__main__':
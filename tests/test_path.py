@@ -2,6 +2,9 @@
 
 import unittest
 import subprocess
+import ctypes
+import signal
+import time
 import os
 import sys
 sys.path.append('..')
@@ -16,5 +19,25 @@ class TestPath(unittest.TestCase):
         self.assertIn(cmd.pid, p.path_check())
         cmd.kill()
 
+    def test_path_duplicate(self):
+        # Only the second of two PATH entries contains a '.'
+        pid = os.fork()
+        if pid == 0:
+            libc = ctypes.CDLL(None)
+            argv = (ctypes.c_char_p * 3)(b'sleep', b'600', None)
+            envp = (ctypes.c_char_p * 3)(b'PATH=/usr/bin', b'PATH=/usr/bin:.', None)
+            libc.execve(b'/bin/sleep', argv, envp)
+            os._exit(1)
+        # Wait for the child to exec before reading its environ
+        for i in range(100):
+            with open('/proc/{}/environ'.format(pid), 'rb') as open_env:
+                if open_env.read() == b'PATH=/usr/bin\x00PATH=/usr/bin:.\x00':
+                    break
+            time.sleep(0.01)
+        p = ProcFinder()
+        self.assertIn(pid, p.path_check())
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
 if __name__ == '__main__':
     unittest.main()
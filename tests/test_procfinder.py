@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import unittest
+import subprocess
 import sys
 sys.path.append('..')
 from procfinder import ProcFinder
@@ -11,5 +12,15 @@ class TestProcFinder(unittest.TestCase):
         p = ProcFinder()        
         self.assertIsInstance(p, ProcFinder)
 
+    def test_run_all_checks(self):
+        cmd = subprocess.Popen(['sleep', '600'], cwd='/tmp')
+        p = ProcFinder()
+        results = p.run_all_checks()
+        self.assertEqual(set(results), {'deleted', 'path', 'promiscuous', 'thread', 'cwd', 'preload'})
+        self.assertIn(cmd.pid, results['cwd'])
+        self.assertEqual(p.run_all_checks(('cwd',)), {'cwd': results['cwd']})
+        cmd.kill()
+        cmd.wait()
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,5 +15,16 @@ class TestPromiscuous(unittest.TestCase):
         self.assertIn(os.getpid(), p.promiscuous_check())
         s.close()
 
+    def test_promiscuous_inode(self):
+        # Inodes must match exactly, 12 must not match socket:[1234]
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        inode = str(os.fstat(s.fileno()).st_ino)
+        p = ProcFinder()
+        flags, link = p._scan_pid(os.getpid(), {inode}, ('promiscuous',))
+        self.assertTrue(flags['promiscuous'])
+        flags, link = p._scan_pid(os.getpid(), {inode[:-1]}, ('promiscuous',))
+        self.assertFalse(flags['promiscuous'])
+        s.close()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+import subprocess
+import tempfile
+import os
+import sys
+sys.path.append('..')
+import procfinder
+from procfinder import ProcFinder
+
+class TestPs(unittest.TestCase):
+
+    def test_ps_hidden_from_ps(self):
+        cmd = subprocess.Popen(['sleep', '600'])
+        with tempfile.TemporaryDirectory() as ps_dir:
+            # Trojaned ps that drops the sleep process from its output
+            with open(os.path.join(ps_dir, 'ps'), 'w') as fake_ps:
+                fake_ps.write('#!/bin/sh\n/usr/bin/ps "$@" | grep -vw {}\n'.format(cmd.pid))
+            os.chmod(os.path.join(ps_dir, 'ps'), 0o755)
+            old_path = os.environ['PATH']
+            os.environ['PATH'] = ps_dir + ':' + old_path
+            try:
+                p = ProcFinder()
+                self.assertIn(cmd.pid, p.ps_check())
+            finally:
+                os.environ['PATH'] = old_path
+        cmd.kill()
+        cmd.wait()
+
+    def test_ps_hidden_from_proc(self):
+        cmd = subprocess.Popen(['sleep', '600'])
+        real_list_pids = procfinder._list_pids
+        # Hooked readdir that drops the sleep process from the /proc listing
+        hidden_list_pids = lambda: [pid for pid in real_list_pids() if pid != cmd.pid]
+        with mock.patch('procfinder._list_pids', hidden_list_pids):
+            p = ProcFinder()
+            self.assertIn(cmd.pid, p.ps_check())
+        cmd.kill()
+        cmd.wait()
+
+    def test_ps_churn(self):
+        cmd_exited = subprocess.Popen(['sleep', '600'])
+        p = ProcFinder()
+        cmd_exited.kill()
+        cmd_exited.wait()
+        cmd_started = subprocess.Popen(['sleep', '600'])
+        ps_pids = p.ps_check()
+        self.assertNotIn(cmd_exited.pid, ps_pids)
+        self.assertNotIn(cmd_started.pid, ps_pids)
+        cmd_started.kill()
+        cmd_started.wait()
+
+if __name__ == '__main__':
+    unittest.main()
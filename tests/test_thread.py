@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+import os
+import sys
+sys.path.append('..')
+from procfinder import ProcFinder
+
+class TestThread(unittest.TestCase):
+
+    def test_thread_unordered(self):
+        # Smallest and largest TID are neither first nor last in directory order
+        p = ProcFinder()
+        with mock.patch('procfinder._iter_dir', return_value=iter(['500', '10', '2000', '600'])):
+            flags, link = p._scan_pid(os.getpid(), None, ('thread',))
+        self.assertTrue(flags['thread'])
+
+    def test_thread_close(self):
+        p = ProcFinder()
+        with mock.patch('procfinder._iter_dir', return_value=iter(['900', '10', '1000', '20'])):
+            flags, link = p._scan_pid(os.getpid(), None, ('thread',))
+        self.assertFalse(flags['thread'])
+
+if __name__ == '__main__':
+    unittest.main()